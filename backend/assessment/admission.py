@@ -0,0 +1,247 @@
+"""Admission control for the OpenRouter-bound endpoints.
+
+Requests take a per-user token first. They then need a per-model slot and a
+global concurrency slot. Waiters queue in a bounded queue. A request is shed
+up front if its estimated wait would run past its deadline, and also if it
+times out while waiting. Shed requests get a ``429`` whose ``Retry-After``
+comes from the token refill time or the observed LLM service time.
+
+Tunables (environment):
+    LLM_MAX_CONCURRENCY        global in-flight LLM calls (default 8)
+    LLM_PER_MODEL_CONCURRENCY  default in-flight calls per model (default 4)
+    LLM_MODEL_CONCURRENCY      per-model overrides, e.g. "openai/gpt-4o=2,foo/bar=6"
+    LLM_MAX_QUEUE              requests allowed to wait for a slot (default 32)
+    LLM_MAX_WAIT_SECONDS       longest a request may wait for a slot (default 20)
+    LLM_USER_RATE_PER_MIN      sustained LLM requests per user (default 6)
+    LLM_USER_BURST             token bucket capacity per user (default 3)
+"""
+import asyncio
+import math
+import os
+import time
+from collections import defaultdict
+from contextlib import asynccontextmanager
+from typing import Dict, Optional
+
+from fastapi import HTTPException
+
+
+def _parse_model_limits(raw: str) -> Dict[str, int]:
+    limits = {}
+    for item in filter(None, (part.strip() for part in raw.split(","))):
+        model, _, limit = item.rpartition("=")
+        limits[model.strip()] = int(limit)
+    return limits
+
+
+class TokenBucket:
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def take(self) -> float:
+        """Consume a token; return 0 on success, else seconds until one is available."""
+        now = time.monotonic()
+        self._refill(now)
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def refund(self) -> None:
+        """Return a token taken for a request that was never admitted."""
+        self.tokens = min(self.capacity, self.tokens + 1)
+
+    def is_full(self) -> bool:
+        self._refill(time.monotonic())
+        return self.tokens >= self.capacity
+
+
+class AdmissionController:
+    def __init__(
+        self,
+        max_concurrency: int = 8,
+        per_model_concurrency: int = 4,
+        model_limits: Optional[Dict[str, int]] = None,
+        max_queue: int = 32,
+        max_wait: float = 20.0,
+        user_rate_per_min: float = 6.0,
+        user_burst: float = 3.0,
+    ):
+        self.max_concurrency = max_concurrency
+        self.per_model_concurrency = per_model_concurrency
+        self.model_limits = model_limits or {}
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self.user_rate = user_rate_per_min / 60.0
+        self.user_burst = user_burst
+
+        # Semaphores are created on first use so they bind to the serving event loop
+        self._global: Optional[asyncio.Semaphore] = None
+        self._models: Dict[str, asyncio.Semaphore] = {}
+        self._buckets: Dict[str, TokenBucket] = {}
+
+        self.waiting = 0
+        self.in_flight = 0
+        self.in_flight_by_model: Dict[str, int] = defaultdict(int)
+        self.admitted = 0
+        self.shed: Dict[str, int] = defaultdict(int)
+        self.waiting_by_model: Dict[str, int] = defaultdict(int)
+        # Unknown until the first call completes; the deadline estimate is skipped until then
+        self.avg_service_seconds: Optional[float] = None
+
+    @classmethod
+    def from_env(cls) -> "AdmissionController":
+        return cls(
+            max_concurrency=int(os.getenv("LLM_MAX_CONCURRENCY", "8")),
+            per_model_concurrency=int(os.getenv("LLM_PER_MODEL_CONCURRENCY", "4")),
+            model_limits=_parse_model_limits(os.getenv("LLM_MODEL_CONCURRENCY", "")),
+            max_queue=int(os.getenv("LLM_MAX_QUEUE", "32")),
+            max_wait=float(os.getenv("LLM_MAX_WAIT_SECONDS", "20")),
+            user_rate_per_min=float(os.getenv("LLM_USER_RATE_PER_MIN", "6")),
+            user_burst=float(os.getenv("LLM_USER_BURST", "3")),
+        )
+
+    def _model_limit(self, model: str) -> int:
+        return min(self.model_limits.get(model, self.per_model_concurrency), self.max_concurrency)
+
+    def _global_semaphore(self) -> asyncio.Semaphore:
+        if self._global is None:
+            self._global = asyncio.Semaphore(self.max_concurrency)
+        return self._global
+
+    def _model_semaphore(self, model: str) -> asyncio.Semaphore:
+        if model not in self._models:
+            self._models[model] = asyncio.Semaphore(self._model_limit(model))
+        return self._models[model]
+
+    def _reject(self, reason: str, retry_after: float, detail: str):
+        self.shed[reason] += 1
+        raise HTTPException(
+            status_code=429,
+            detail=detail,
+            headers={"Retry-After": str(max(1, math.ceil(retry_after)))},
+        )
+
+    def _check_rate(self, user_key: str) -> TokenBucket:
+        bucket = self._buckets.get(user_key)
+        if bucket is None:
+            if len(self._buckets) >= 10000:
+                # Full buckets carry no state worth keeping
+                for key in [k for k, b in self._buckets.items() if b.is_full()]:
+                    del self._buckets[key]
+            bucket = self._buckets[user_key] = TokenBucket(self.user_rate, self.user_burst)
+        wait = bucket.take()
+        if wait:
+            self._reject("rate_limited", wait, "Too many requests, please slow down")
+        return bucket
+
+    def _estimated_wait(self, model: str) -> Optional[float]:
+        """Expected queueing delay for a newcomer, from the average LLM call time.
+
+        Takes the worse of the model's and the global queue. Returns None until
+        a call has been observed.
+        """
+        if self.avg_service_seconds is None:
+            return None
+        model_slots = self._model_limit(model)
+        model_ahead = self.waiting_by_model[model] + max(
+            0, self.in_flight_by_model[model] - model_slots + 1
+        )
+        global_ahead = self.waiting + max(0, self.in_flight - self.max_concurrency + 1)
+        return self.avg_service_seconds * max(
+            model_ahead / model_slots, global_ahead / self.max_concurrency
+        )
+
+    @staticmethod
+    async def _acquire(sem: asyncio.Semaphore, deadline: float) -> None:
+        if not sem.locked():
+            # Uncontended acquire completes without yielding, so no other request
+            # can slip in between the locked() checks in _admit and taking the slot
+            await sem.acquire()
+            return
+        await asyncio.wait_for(sem.acquire(), timeout=max(0.0, deadline - time.monotonic()))
+
+    async def _admit(self, model: str):
+        """Acquire the model and global slots, shedding if the wait would be too long."""
+        model_sem = self._model_semaphore(model)
+        global_sem = self._global_semaphore()
+        # The queue bound and deadline estimate only apply when the request must wait
+        if model_sem.locked() or global_sem.locked():
+            estimate = self._estimated_wait(model)
+            if self.waiting >= self.max_queue:
+                self._reject("queue_full", estimate or 0, "Service busy, please retry later")
+            if estimate is not None and estimate > self.max_wait:
+                self._reject("deadline", estimate, "Service busy, please retry later")
+
+        deadline = time.monotonic() + self.max_wait
+        self.waiting += 1
+        self.waiting_by_model[model] += 1
+        try:
+            await self._acquire(model_sem, deadline)
+            try:
+                await self._acquire(global_sem, deadline)
+            except BaseException:
+                model_sem.release()
+                raise
+        except asyncio.TimeoutError:
+            retry_after = self._estimated_wait(model) or self.max_wait
+            self._reject("deadline", retry_after, "Service busy, please retry later")
+        finally:
+            self.waiting -= 1
+            self.waiting_by_model[model] -= 1
+        return model_sem, global_sem
+
+    @asynccontextmanager
+    async def slot(self, user_key: str, model: str):
+        bucket = self._check_rate(user_key)
+        try:
+            model_sem, global_sem = await self._admit(model)
+        except BaseException:
+            # Load shedding (or a disconnect while queued) must not cost the user quota
+            bucket.refund()
+            raise
+
+        self.admitted += 1
+        self.in_flight += 1
+        self.in_flight_by_model[model] += 1
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            elapsed = time.monotonic() - started
+            if self.avg_service_seconds is None:
+                self.avg_service_seconds = elapsed
+            else:
+                self.avg_service_seconds = 0.8 * self.avg_service_seconds + 0.2 * elapsed
+            self.in_flight -= 1
+            self.in_flight_by_model[model] -= 1
+            global_sem.release()
+            model_sem.release()
+
+    def stats(self) -> dict:
+        return {
+            "queue_depth": self.waiting,
+            "max_queue": self.max_queue,
+            "in_flight": self.in_flight,
+            "max_concurrency": self.max_concurrency,
+            "in_flight_by_model": {
+                model: {"in_flight": self.in_flight_by_model[model], "limit": self._model_limit(model)}
+                for model in self._models
+            },
+            "admitted": self.admitted,
+            "shed": dict(self.shed),
+            "avg_service_seconds": (
+                round(self.avg_service_seconds, 3) if self.avg_service_seconds is not None else None
+            ),
+            "tracked_users": len(self._buckets),
+        }
+
+
+admission = AdmissionController.from_env()
@@ -0,0 +1,409 @@
+"""Streaming NDJSON export and compressed archival of ``Test`` rows.
+
+Export walks ``tests`` with a server-side cursor (``yield_per``). It encodes
+one record per line and compresses incrementally, so memory use stays flat
+however large the table is.
+
+Archival moves tests older than a retention window into segment files under
+``ARCHIVE_DIR``. A segment is a run of independently compressed blocks (gzip
+members or zstd frames), and each block holds up to ``BLOCK_SIZE`` NDJSON
+records. Concatenated members and frames are valid streams in their own
+right, so a whole segment can still be read with ``zcat``/``zstdcat``. Each
+archived test keeps an ``ArchivedTest`` row pointing at its block, so it can be
+fetched on its own by decompressing one small block.
+
+zstd needs the optional ``zstandard`` package; gzip always works.
+
+CLI (run from the backend directory)::
+
+    python -m assessment.archive export -o tests.ndjson.gz [--codec zstd] [--include-archived]
+    python -m assessment.archive archive --retention-days 180 [--vacuum]
+    python -m assessment.archive fetch 42
+"""
+import argparse
+import gzip
+import itertools
+import os
+import sys
+import uuid
+import zlib
+from datetime import datetime, timedelta, timezone
+from typing import Iterable, Iterator, Optional
+
+import orjson
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+from sqlalchemy.schema import CreateIndex, CreateTable
+
+from assessment.models.test import Test
+from assessment.models.archived_test import ArchivedTest
+from assessment.history_cache import bump_history_version
+
+try:
+    import zstandard
+except ImportError:  # optional dependency
+    zstandard = None
+
+ARCHIVE_DIR = os.getenv("ARCHIVE_DIR", "/app/db/archive")
+BLOCK_SIZE = 64
+CODECS = ("gzip", "zstd", "none")
+EXTENSIONS = {"gzip": ".ndjson.gz", "zstd": ".ndjson.zst", "none": ".ndjson"}
+MEDIA_TYPES = {"gzip": "application/gzip", "zstd": "application/zstd", "none": "application/x-ndjson"}
+
+
+def check_codec(codec: str) -> None:
+    if codec not in CODECS:
+        raise ValueError(f"Unknown codec {codec!r}, expected one of {CODECS}")
+    if codec == "zstd" and zstandard is None:
+        raise ValueError("zstd output requires the 'zstandard' package")
+
+
+def naive_utc(value: Optional[datetime]) -> Optional[datetime]:
+    """Convert an aware datetime to naive UTC, matching how ``tests`` stores timestamps."""
+    if value is None or value.tzinfo is None:
+        return value
+    return value.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+def export_record(test) -> dict:
+    return {
+        "id": test.id,
+        "user_id": test.user_id,
+        "questions": test.questions,
+        "answers": test.answers,
+        "score": test.score,
+        "rule_based_strength": test.rule_based_strength,
+        "ml_based_strength": test.ml_based_strength,
+        "feedback": test.feedback,
+        "created_at": test.created_at,
+        "completed_at": test.completed_at,
+    }
+
+
+def encode_record(record: dict) -> bytes:
+    return orjson.dumps(record, option=orjson.OPT_NON_STR_KEYS) + b"\n"
+
+
+def iter_tests(
+    db: Session,
+    before: Optional[datetime] = None,
+    user_id: Optional[int] = None,
+    batch_size: int = 500,
+) -> Iterator[Test]:
+    query = db.query(Test)
+    if before is not None:
+        query = query.filter(Test.created_at < before)
+    if user_id is not None:
+        query = query.filter(Test.user_id == user_id)
+    # yield_per streams results (server-side cursor where the driver supports it)
+    yield from query.order_by(Test.id).yield_per(batch_size)
+
+
+def _compressor(codec: str):
+    if codec == "gzip":
+        return zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits=31 -> gzip container
+    if codec == "zstd":
+        return zstandard.ZstdCompressor().compressobj()
+    return None
+
+
+def compress_stream(chunks: Iterable[bytes], codec: str = "gzip", flush_size: int = 64 * 1024) -> Iterator[bytes]:
+    """Compress ``chunks`` incrementally, yielding output roughly every ``flush_size`` input bytes."""
+    check_codec(codec)
+    compressor = _compressor(codec)
+    buffer = []
+    pending = 0
+    for chunk in chunks:
+        buffer.append(chunk)
+        pending += len(chunk)
+        if pending >= flush_size:
+            data = b"".join(buffer)
+            buffer, pending = [], 0
+            out = compressor.compress(data) if compressor else data
+            if out:
+                yield out
+    data = b"".join(buffer)
+    if compressor:
+        out = compressor.compress(data) + compressor.flush()
+    else:
+        out = data
+    if out:
+        yield out
+
+
+def _compress_block(data: bytes, codec: str) -> bytes:
+    if codec == "gzip":
+        return gzip.compress(data)
+    if codec == "zstd":
+        return zstandard.ZstdCompressor().compress(data)
+    return data
+
+
+def _decompress_block(data: bytes, codec: str) -> bytes:
+    if codec == "gzip":
+        return gzip.decompress(data)
+    if codec == "zstd":
+        return zstandard.ZstdDecompressor().decompress(data)
+    return data
+
+
+def _segment_codec(segment: str) -> str:
+    for codec, ext in EXTENSIONS.items():
+        if segment.endswith(ext):
+            return codec
+    raise ValueError(f"Unrecognised archive segment {segment!r}")
+
+
+def iter_archived_lines(
+    db: Session,
+    before: Optional[datetime] = None,
+    user_id: Optional[int] = None,
+    archive_dir: str = ARCHIVE_DIR,
+) -> Iterator[bytes]:
+    """Yield archived records that the ``archived_tests`` index points to.
+
+    Driven by the index rather than by scanning segment files, so blocks left
+    unreferenced by an interrupted archive run (whose tests are still live in
+    ``tests``) are never exported twice.
+    """
+    query = db.query(ArchivedTest)
+    if before is not None:
+        query = query.filter(ArchivedTest.created_at < before)
+    if user_id is not None:
+        query = query.filter(ArchivedTest.user_id == user_id)
+    entries = query.order_by(
+        ArchivedTest.segment, ArchivedTest.block_offset, ArchivedTest.test_id
+    ).yield_per(1000)
+
+    fh = None
+    current_segment = None
+    try:
+        for (segment, offset, length), group in itertools.groupby(
+            entries, key=lambda e: (e.segment, e.block_offset, e.block_length)
+        ):
+            wanted = {entry.test_id for entry in group}
+            if segment != current_segment:
+                if fh is not None:
+                    fh.close()
+                codec = _segment_codec(segment)
+                check_codec(codec)
+                fh = open(os.path.join(archive_dir, segment), "rb")
+                current_segment = segment
+            fh.seek(offset)
+            for line in _decompress_block(fh.read(length), codec).splitlines():
+                if line.strip() and orjson.loads(line)["id"] in wanted:
+                    yield line + b"\n"
+    finally:
+        if fh is not None:
+            fh.close()
+
+
+def export_lines(
+    db: Session,
+    before: Optional[datetime] = None,
+    user_id: Optional[int] = None,
+    include_archived: bool = False,
+    archive_dir: str = ARCHIVE_DIR,
+) -> Iterator[bytes]:
+    if include_archived:
+        yield from iter_archived_lines(db, before=before, user_id=user_id, archive_dir=archive_dir)
+    for test in iter_tests(db, before=before, user_id=user_id):
+        yield encode_record(export_record(test))
+
+
+def export_stream(db: Session, codec: str = "gzip", **filters) -> Iterator[bytes]:
+    return compress_stream(export_lines(db, **filters), codec)
+
+
+def ensure_tests_autoincrement(db: Session) -> None:
+    """Rebuild a legacy SQLite ``tests`` table with AUTOINCREMENT.
+
+    Without it SQLite hands out ``max(id) + 1``, so archiving the newest test
+    would let its id be reused and clash with the ``archived_tests`` index.
+    Tables created by the current model already use AUTOINCREMENT, and other
+    databases use sequences that never reuse ids.
+    """
+    if db.get_bind().dialect.name != "sqlite":
+        return
+    ddl = db.execute(text(
+        "SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'tests'"
+    )).scalar()
+    if ddl is None or "AUTOINCREMENT" in ddl.upper():
+        return
+
+    existing = {row[1] for row in db.execute(text("PRAGMA table_info(tests)"))}
+    columns = ", ".join(c.name for c in Test.__table__.columns if c.name in existing)
+    dialect = db.get_bind().dialect
+    statements = [f"DROP INDEX IF EXISTS {index.name}" for index in Test.__table__.indexes]
+    statements.append("ALTER TABLE tests RENAME TO tests_legacy")
+    statements.append(str(CreateTable(Test.__table__).compile(dialect=dialect)))
+    statements.extend(str(CreateIndex(index).compile(dialect=dialect)) for index in Test.__table__.indexes)
+    # Copying explicit ids seeds sqlite_sequence with the current maximum
+    statements.append(f"INSERT INTO tests ({columns}) SELECT {columns} FROM tests_legacy")
+    statements.append("DROP TABLE tests_legacy")
+
+    db.commit()
+    # pysqlite runs DDL outside any transaction, so wrap the rebuild explicitly
+    raw = db.connection().connection.dbapi_connection
+    try:
+        raw.executescript("BEGIN;\n" + ";\n".join(statements) + ";\nCOMMIT;")
+    except Exception:
+        raw.rollback()
+        db.rollback()
+        raise
+    db.commit()
+
+
+def archive_tests(
+    db: Session,
+    retention_days: int,
+    codec: str = "gzip",
+    archive_dir: str = ARCHIVE_DIR,
+    batch_size: int = 500,
+) -> int:
+    """Move tests created more than ``retention_days`` ago into a new segment file.
+
+    Each batch is written and fsynced before the index rows are inserted and the
+    tests deleted in one transaction. If that transaction fails, the batch's
+    blocks are truncated off the segment again. A hard crash can leave
+    unreferenced blocks behind, but it never loses a test.
+    """
+    check_codec(codec)
+    if codec == "none":
+        raise ValueError("Archival requires a compressing codec")
+    os.makedirs(archive_dir, exist_ok=True)
+    cutoff = datetime.utcnow() - timedelta(days=retention_days)
+    ensure_tests_autoincrement(db)
+
+    # Unique per run, so a later run can never append to (or remove) an earlier segment
+    segment = f"tests-{datetime.utcnow():%Y%m%dT%H%M%S}-{uuid.uuid4().hex[:8]}{EXTENSIONS[codec]}"
+    path = os.path.join(archive_dir, segment)
+    archived = 0
+    with open(path, "xb") as fh:
+        while True:
+            batch = db.query(Test).filter(
+                Test.created_at < cutoff,
+            ).order_by(Test.id).limit(batch_size).all()
+            if not batch:
+                break
+
+            now = datetime.utcnow()
+            batch_start = fh.tell()
+            index_rows = []
+            for start in range(0, len(batch), BLOCK_SIZE):
+                block_tests = batch[start:start + BLOCK_SIZE]
+                block = _compress_block(
+                    b"".join(encode_record(export_record(t)) for t in block_tests), codec
+                )
+                offset = fh.tell()
+                fh.write(block)
+                index_rows.extend(
+                    ArchivedTest(
+                        test_id=t.id,
+                        user_id=t.user_id,
+                        segment=segment,
+                        block_offset=offset,
+                        block_length=len(block),
+                        score=t.score,
+                        created_at=t.created_at,
+                        archived_at=now,
+                    )
+                    for t in block_tests
+                )
+            fh.flush()
+            os.fsync(fh.fileno())
+
+            try:
+                db.add_all(index_rows)
+                # Archived tests drop out of test-history, so invalidate its ETags
+                for user_id in {t.user_id for t in batch if t.score is not None}:
+                    bump_history_version(db, user_id)
+                for t in batch:
+                    db.delete(t)
+                db.commit()
+            except Exception:
+                db.rollback()
+                fh.truncate(batch_start)
+                raise
+            archived += len(batch)
+
+    if not archived:
+        os.remove(path)
+    return archived
+
+
+def load_archived_test(db: Session, test_id: int, archive_dir: str = ARCHIVE_DIR) -> Optional[dict]:
+    entry = db.query(ArchivedTest).filter(ArchivedTest.test_id == test_id).first()
+    if entry is None:
+        return None
+    with open(os.path.join(archive_dir, entry.segment), "rb") as fh:
+        fh.seek(entry.block_offset)
+        block = fh.read(entry.block_length)
+    for line in _decompress_block(block, _segment_codec(entry.segment)).splitlines():
+        record = orjson.loads(line)
+        if record["id"] == test_id:
+            return record
+    return None
+
+
+def main(argv=None):
+    from database.session import SessionLocal, engine, Base
+    import auth.models  # noqa: F401  registers ``users`` for the tests.user_id foreign key
+
+    parser = argparse.ArgumentParser(description="Export or archive assessment tests")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    export = sub.add_parser("export", help="stream tests as compressed NDJSON")
+    export.add_argument("-o", "--output", default="-", help="output file ('-' for stdout)")
+    export.add_argument("--codec", choices=CODECS, default="gzip")
+    export.add_argument("--user-id", type=int)
+    export.add_argument("--before", type=datetime.fromisoformat, help="only tests created before this ISO date")
+    export.add_argument("--include-archived", action="store_true")
+
+    archive = sub.add_parser("archive", help="move old tests into compressed segments")
+    archive.add_argument("--retention-days", type=int, required=True)
+    archive.add_argument("--codec", choices=("gzip", "zstd"), default="gzip")
+    archive.add_argument("--vacuum", action="store_true", help="reclaim SQLite file space afterwards")
+
+    fetch = sub.add_parser("fetch", help="print one archived test")
+    fetch.add_argument("test_id", type=int)
+
+    args = parser.parse_args(argv)
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    try:
+        if args.command == "export":
+            chunks = export_stream(
+                db,
+                args.codec,
+                before=naive_utc(args.before),
+                user_id=args.user_id,
+                include_archived=args.include_archived,
+            )
+            out = sys.stdout.buffer if args.output == "-" else open(args.output, "wb")
+            try:
+                for chunk in chunks:
+                    out.write(chunk)
+            finally:
+                if out is not sys.stdout.buffer:
+                    out.close()
+        elif args.command == "archive":
+            count = archive_tests(db, args.retention_days, args.codec)
+            print(f"Archived {count} test(s) into {ARCHIVE_DIR}", file=sys.stderr)
+            if args.vacuum and count and engine.dialect.name == "sqlite":
+                db.close()
+                with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+                    conn.execute(text("VACUUM"))
+        else:
+            record = load_archived_test(db, args.test_id)
+            if record is None:
+                print(f"Test {args.test_id} is not archived", file=sys.stderr)
+                return 1
+            sys.stdout.buffer.write(encode_record(record))
+    finally:
+        db.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
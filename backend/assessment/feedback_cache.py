@@ -0,0 +1,201 @@
+"""Two-tier cache for LLM-generated test feedback.
+
+Feedback is keyed by a canonical hash of the test's questions, the
+per-question correctness vector and the score. The prompt only varies along
+those dimensions in ways the feedback is expected to reflect, so pooled or
+reused tests with the same pattern of right and wrong answers share an entry.
+The key also covers the model and a hash of the feedback prompt templates, so
+switching either one stops serving feedback generated under the old setup.
+
+Tier 1 is an in-process LRU. Tier 2 is the ``feedback_cache`` table, shared by
+all workers and surviving restarts. Both tiers expire entries after
+``FEEDBACK_CACHE_TTL_SECONDS``. The LRU holds at most ``FEEDBACK_CACHE_SIZE``
+entries. The table is trimmed to ``FEEDBACK_CACHE_DB_MAX_ROWS``, dropping the
+least recently used rows first. Set ``FEEDBACK_CACHE_DB=0`` to use memory only.
+"""
+import hashlib
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+import orjson
+from sqlalchemy.exc import SQLAlchemyError
+
+from database.session import SessionLocal
+from assessment.models.feedback_cache_entry import FeedbackCacheEntry
+from assessment.prompts import FEEDBACK_PROMPT, FEEDBACK_QUESTION_DETAIL
+
+logger = logging.getLogger(__name__)
+
+FEEDBACK_CACHE_SIZE = int(os.getenv("FEEDBACK_CACHE_SIZE", "1024"))
+FEEDBACK_CACHE_TTL_SECONDS = int(os.getenv("FEEDBACK_CACHE_TTL_SECONDS", str(7 * 24 * 3600)))
+FEEDBACK_CACHE_DB = os.getenv("FEEDBACK_CACHE_DB", "1") != "0"
+FEEDBACK_CACHE_DB_MAX_ROWS = int(os.getenv("FEEDBACK_CACHE_DB_MAX_ROWS", "50000"))
+PRUNE_EVERY = 100
+PROMPT_VERSION = hashlib.sha256(
+    (FEEDBACK_PROMPT + FEEDBACK_QUESTION_DETAIL).encode()
+).hexdigest()[:16]
+
+
+def feedback_key(questions: List[dict], answers: Dict[int, int], score: float, model: str) -> str:
+    ordered = sorted(questions, key=lambda q: q["id"])
+    canonical = {
+        "model": model,
+        "prompt": PROMPT_VERSION,
+        "questions": [
+            [q["id"], q["text"], q["options"], q["correct_index"], q.get("explanation") or ""]
+            for q in ordered
+        ],
+        "correct": [answers.get(q["id"]) == q["correct_index"] for q in ordered],
+        "score": round(float(score), 4),
+    }
+    return hashlib.sha256(orjson.dumps(canonical, option=orjson.OPT_SORT_KEYS)).hexdigest()
+
+
+class FeedbackCache:
+    def __init__(
+        self,
+        maxsize: int = FEEDBACK_CACHE_SIZE,
+        ttl_seconds: int = FEEDBACK_CACHE_TTL_SECONDS,
+        use_db: bool = FEEDBACK_CACHE_DB,
+        db_max_rows: int = FEEDBACK_CACHE_DB_MAX_ROWS,
+    ):
+        self.maxsize = maxsize
+        self.ttl_seconds = ttl_seconds
+        self.use_db = use_db
+        self.db_max_rows = db_max_rows
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()  # key -> (expires_monotonic, feedback)
+        self._lock = threading.Lock()
+        self._puts = 0
+        self.counters = {
+            "memory_hits": 0,
+            "db_hits": 0,
+            "misses": 0,
+            "memory_evictions": 0,
+            "expirations": 0,
+            "db_errors": 0,
+        }
+
+    def _remember(self, key: str, feedback: dict, ttl: float) -> None:
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, feedback)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.counters["memory_evictions"] += 1
+
+    def _get_memory(self, key: str) -> Optional[dict]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires, feedback = entry
+            if expires < time.monotonic():
+                del self._entries[key]
+                self.counters["expirations"] += 1
+                return None
+            self._entries.move_to_end(key)
+            return feedback
+
+    def _get_db(self, key: str) -> Optional[dict]:
+        db = SessionLocal()
+        try:
+            entry = db.query(FeedbackCacheEntry).filter(FeedbackCacheEntry.key == key).first()
+            if entry is None:
+                return None
+            now = datetime.utcnow()
+            if entry.expires_at < now:
+                db.delete(entry)
+                db.commit()
+                self.counters["expirations"] += 1
+                return None
+            entry.hits += 1
+            entry.last_used_at = now
+            feedback = entry.feedback
+            remaining = (entry.expires_at - now).total_seconds()
+            db.commit()
+            self._remember(key, feedback, remaining)
+            return feedback
+        except SQLAlchemyError as e:
+            db.rollback()
+            self.counters["db_errors"] += 1
+            logger.warning(f"Feedback cache lookup failed: {e}")
+            return None
+        finally:
+            db.close()
+
+    def get(self, key: str) -> Optional[dict]:
+        feedback = self._get_memory(key)
+        if feedback is not None:
+            self.counters["memory_hits"] += 1
+            return feedback
+        if self.use_db:
+            feedback = self._get_db(key)
+            if feedback is not None:
+                self.counters["db_hits"] += 1
+                return feedback
+        self.counters["misses"] += 1
+        return None
+
+    def put(self, key: str, feedback: dict) -> None:
+        self._remember(key, feedback, self.ttl_seconds)
+        if not self.use_db:
+            return
+        db = SessionLocal()
+        try:
+            now = datetime.utcnow()
+            db.merge(FeedbackCacheEntry(
+                key=key,
+                feedback=feedback,
+                hits=0,
+                created_at=now,
+                last_used_at=now,
+                expires_at=now + timedelta(seconds=self.ttl_seconds),
+            ))
+            db.commit()
+            self._puts += 1
+            if self._puts % PRUNE_EVERY == 0:
+                self._prune(db, now)
+        except SQLAlchemyError as e:
+            # Another worker may have stored the same key first; either copy is fine
+            db.rollback()
+            self.counters["db_errors"] += 1
+            logger.warning(f"Feedback cache store failed: {e}")
+        finally:
+            db.close()
+
+    def _prune(self, db, now: datetime) -> None:
+        db.query(FeedbackCacheEntry).filter(
+            FeedbackCacheEntry.expires_at < now
+        ).delete(synchronize_session=False)
+        overflow = db.query(FeedbackCacheEntry).count() - self.db_max_rows
+        if overflow > 0:
+            stale = db.query(FeedbackCacheEntry.key).order_by(
+                FeedbackCacheEntry.last_used_at
+            ).limit(overflow).subquery()
+            db.query(FeedbackCacheEntry).filter(
+                FeedbackCacheEntry.key.in_(stale.select())
+            ).delete(synchronize_session=False)
+        db.commit()
+
+    def stats(self) -> dict:
+        lookups = self.counters["memory_hits"] + self.counters["db_hits"] + self.counters["misses"]
+        hits = self.counters["memory_hits"] + self.counters["db_hits"]
+        return {
+            **self.counters,
+            "lookups": lookups,
+            "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+            "memory_entries": len(self._entries),
+            "memory_maxsize": self.maxsize,
+            "ttl_seconds": self.ttl_seconds,
+            "db_enabled": self.use_db,
+        }
+
+
+feedback_cache = FeedbackCache()
@@ -0,0 +1,108 @@
+"""Versioning, ETags and an in-process body cache for ``/assessment/test-history``.
+
+A user's history only changes when ``evaluate_test`` commits, so each user has a
+``HistoryVersion`` counter bumped in that transaction. The ETag is that counter
+plus a per-database epoch and ``HISTORY_FORMAT_VERSION``, letting conditional
+requests be answered without reading ``tests`` while never matching across a
+database reset or a change to the response shape.
+Serialized bodies are cached under (epoch, user, version, page); a version bump makes
+older entries unreachable and they age out of the LRU.
+
+``HISTORY_CACHE_SIZE`` sets the number of cached bodies (0 disables the cache).
+"""
+import os
+import threading
+import uuid
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from assessment.models.history_version import HistoryEpoch, HistoryVersion
+
+HISTORY_CACHE_SIZE = int(os.getenv("HISTORY_CACHE_SIZE", "256"))
+# Bump whenever the serialized test-history shape changes
+HISTORY_FORMAT_VERSION = 1
+
+def _dialect_insert(db: Session):
+    dialect = db.get_bind().dialect.name
+    if dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    elif dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        raise RuntimeError(f"Unsupported database dialect for history versions: {dialect}")
+    return insert
+
+
+def epoch_subquery():
+    """Scalar subquery for the epoch, so it is read in the same query as the version."""
+    return select(HistoryEpoch.epoch).where(HistoryEpoch.id == 1).scalar_subquery()
+
+
+def ensure_database_epoch(db: Session) -> str:
+    """Mint the database's epoch token if it does not exist yet, and return it."""
+    insert = _dialect_insert(db)
+    db.execute(insert(HistoryEpoch).values(id=1, epoch=uuid.uuid4().hex).on_conflict_do_nothing(
+        index_elements=[HistoryEpoch.id],
+    ))
+    db.commit()
+    return db.query(HistoryEpoch.epoch).filter(HistoryEpoch.id == 1).scalar()
+
+
+def bump_history_version(db: Session, user_id: int) -> None:
+    """Increment the user's history version with a single upsert; the caller commits.
+
+    An upsert (rather than update-then-insert) keeps concurrent first
+    evaluations for the same user from racing on the row's insert.
+    """
+    insert = _dialect_insert(db)
+    stmt = insert(HistoryVersion).values(user_id=user_id, version=1)
+    db.execute(stmt.on_conflict_do_update(
+        index_elements=[HistoryVersion.user_id],
+        set_={"version": HistoryVersion.version + 1},
+    ))
+
+
+def history_etag(epoch: str, user_id: int, version: int, offset: int, limit: Optional[int]) -> str:
+    page = f'{offset}-{limit if limit is not None else "all"}'
+    return f'"h{HISTORY_FORMAT_VERSION}-{epoch[:12]}-{user_id}-{version}-{page}"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Weak comparison, as RFC 9110 requires for If-None-Match."""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    candidates = (tag.strip() for tag in if_none_match.split(","))
+    return any(tag.removeprefix("W/") == etag for tag in candidates)
+
+
+class HistoryBodyCache:
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._entries: "OrderedDict[Tuple, bytes]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Tuple) -> Optional[bytes]:
+        if self.maxsize <= 0:
+            return None
+        with self._lock:
+            body = self._entries.get(key)
+            if body is not None:
+                self._entries.move_to_end(key)
+            return body
+
+    def put(self, key: Tuple, body: bytes) -> None:
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._entries[key] = body
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+
+history_body_cache = HistoryBodyCache(HISTORY_CACHE_SIZE)
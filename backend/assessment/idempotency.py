@@ -0,0 +1,227 @@
+"""``Idempotency-Key`` support for the LLM-backed endpoints.
+
+The first request with a given (user, endpoint, key) claims a row in
+``idempotency_records`` and runs the handler. A successful response is stored
+on that row until ``IDEMPOTENCY_TTL_SECONDS`` passes. Duplicates never run the
+handler:
+
+* in the same process they await the first execution's future (and, if that
+  execution is cancelled, go back to claiming the key themselves);
+* in another worker they poll the row until it completes (or give up with 409);
+* once it has completed they get the stored response replayed.
+
+If the first execution fails, its claim is released so that a retry can run
+again. A claim held for longer than ``IDEMPOTENCY_LEASE_SECONDS`` is treated as
+orphaned by a dead worker, and the next duplicate takes it over. A key reused
+with a different request body is rejected with 422.
+"""
+import asyncio
+import hashlib
+import os
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+
+from fastapi import HTTPException, Response
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from assessment.models.idempotency_record import IdempotencyRecord
+
+IDEMPOTENCY_TTL_SECONDS = int(os.getenv("IDEMPOTENCY_TTL_SECONDS", "86400"))
+IDEMPOTENCY_WAIT_SECONDS = float(os.getenv("IDEMPOTENCY_WAIT_SECONDS", "90"))
+# An in-progress claim older than this is assumed orphaned by a dead worker
+IDEMPOTENCY_LEASE_SECONDS = float(os.getenv("IDEMPOTENCY_LEASE_SECONDS", str(IDEMPOTENCY_WAIT_SECONDS)))
+POLL_INTERVAL = 0.25
+MAX_KEY_LENGTH = 255
+
+Outcome = Tuple[int, bytes, Optional[str]]
+# scope -> (request fingerprint, future resolving to the first execution's outcome,
+# or to None if it was cancelled and waiters should claim the key themselves)
+_inflight: Dict[Tuple[str, str, str], Tuple[str, "asyncio.Future[Optional[Outcome]]"]] = {}
+
+
+def fingerprint(payload: bytes) -> str:
+    return hashlib.sha256(payload).hexdigest()
+
+
+def _replay(outcome: Outcome) -> Response:
+    status_code, body, media_type = outcome
+    return Response(
+        content=body,
+        status_code=status_code,
+        media_type=media_type,
+        headers={"Idempotent-Replayed": "true"},
+    )
+
+
+def _find(db: Session, scope: Tuple[str, str, str]) -> Optional[IdempotencyRecord]:
+    user_key, endpoint, key = scope
+    return db.query(IdempotencyRecord).filter(
+        IdempotencyRecord.user_key == user_key,
+        IdempotencyRecord.endpoint == endpoint,
+        IdempotencyRecord.key == key,
+    ).first()
+
+
+def _check_fingerprint(record: IdempotencyRecord, request_fingerprint: str) -> None:
+    if record.fingerprint != request_fingerprint:
+        raise HTTPException(
+            status_code=422,
+            detail="Idempotency-Key was already used with a different request",
+        )
+
+
+def _claim(db: Session, scope, request_fingerprint: str, now: datetime) -> bool:
+    """Insert the in-progress row; False if another worker claimed it first."""
+    user_key, endpoint, key = scope
+    db.query(IdempotencyRecord).filter(
+        IdempotencyRecord.expires_at < now
+    ).delete(synchronize_session=False)
+    db.add(IdempotencyRecord(
+        user_key=user_key,
+        endpoint=endpoint,
+        key=key,
+        fingerprint=request_fingerprint,
+        status="in_progress",
+        created_at=now,
+        claimed_at=now,
+        expires_at=now + timedelta(seconds=IDEMPOTENCY_TTL_SECONDS),
+    ))
+    try:
+        db.commit()
+        return True
+    except IntegrityError:
+        db.rollback()
+        return False
+
+
+def _take_over(db: Session, scope, now: datetime) -> bool:
+    """Re-claim an in-progress row whose lease ran out (its worker likely died)."""
+    user_key, endpoint, key = scope
+    stale_before = now - timedelta(seconds=IDEMPOTENCY_LEASE_SECONDS)
+    updated = db.query(IdempotencyRecord).filter(
+        IdempotencyRecord.user_key == user_key,
+        IdempotencyRecord.endpoint == endpoint,
+        IdempotencyRecord.key == key,
+        IdempotencyRecord.status == "in_progress",
+        IdempotencyRecord.claimed_at < stale_before,
+    ).update({
+        IdempotencyRecord.claimed_at: now,
+        IdempotencyRecord.expires_at: now + timedelta(seconds=IDEMPOTENCY_TTL_SECONDS),
+    }, synchronize_session=False)
+    db.commit()
+    return updated == 1
+
+
+async def _claim_or_replay(db: Session, scope, request_fingerprint: str) -> Tuple[Optional[Response], Optional[datetime]]:
+    """Either own the key, returning ``(None, claimed_at)``, or return ``(replay, None)``.
+
+    Waits for another worker's in-progress execution to finish, taking the
+    claim over if its lease expires, and gives up with 409 after
+    ``IDEMPOTENCY_WAIT_SECONDS``.
+    """
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + IDEMPOTENCY_WAIT_SECONDS
+    while True:
+        now = datetime.utcnow()
+        record = _find(db, scope)
+        if record is not None and record.expires_at < now:
+            db.delete(record)
+            db.commit()
+            record = None
+        if record is None:
+            if _claim(db, scope, request_fingerprint, now):
+                return None, now
+        else:
+            _check_fingerprint(record, request_fingerprint)
+            if record.status == "completed":
+                return _replay((record.status_code, record.body, record.media_type)), None
+            lease_expired = record.claimed_at < now - timedelta(seconds=IDEMPOTENCY_LEASE_SECONDS)
+            if lease_expired and _take_over(db, scope, now):
+                return None, now
+
+        if loop.time() >= deadline:
+            raise HTTPException(
+                status_code=409,
+                detail="A request with this Idempotency-Key is still being processed",
+                headers={"Retry-After": "1"},
+            )
+        await asyncio.sleep(POLL_INTERVAL)
+        db.rollback()  # end the read transaction so the next query sees new commits
+
+
+def _owned_record(db: Session, scope, claimed_at: datetime) -> Optional[IdempotencyRecord]:
+    """The in-progress row, if our claim on it has not been taken over."""
+    record = _find(db, scope)
+    if record is None or record.status != "in_progress" or record.claimed_at != claimed_at:
+        return None
+    return record
+
+
+def _release(db: Session, scope, claimed_at: datetime) -> None:
+    db.rollback()
+    record = _owned_record(db, scope, claimed_at)
+    if record is not None:
+        db.delete(record)
+        db.commit()
+
+
+async def run_idempotent(
+    db: Session,
+    user_key: str,
+    endpoint: str,
+    key: Optional[str],
+    request_fingerprint: str,
+    handler: Callable[[], Awaitable[Response]],
+) -> Response:
+    if key is None:
+        return await handler()
+    if not key or len(key) > MAX_KEY_LENGTH:
+        raise HTTPException(status_code=400, detail="Invalid Idempotency-Key")
+
+    scope = (user_key, endpoint, key)
+    while scope in _inflight:
+        pending_fingerprint, future = _inflight[scope]
+        if pending_fingerprint != request_fingerprint:
+            raise HTTPException(
+                status_code=422,
+                detail="Idempotency-Key was already used with a different request",
+            )
+        outcome = await asyncio.shield(future)
+        if outcome is not None:
+            return _replay(outcome)
+        # The first execution was cancelled and released its claim; compete for it again
+
+    replay, claimed_at = await _claim_or_replay(db, scope, request_fingerprint)
+    if replay is not None:
+        return replay
+
+    future = asyncio.get_running_loop().create_future()
+    _inflight[scope] = (request_fingerprint, future)
+    try:
+        response = await handler()
+        outcome = (response.status_code, bytes(response.body), response.media_type)
+        if 200 <= response.status_code < 300:
+            # Skip the write if our lease ran out and another worker took over
+            record = _owned_record(db, scope, claimed_at)
+            if record is not None:
+                record.status = "completed"
+                record.status_code, record.body, record.media_type = outcome
+                db.commit()
+        else:
+            _release(db, scope, claimed_at)
+        future.set_result(outcome)
+        return response
+    except asyncio.CancelledError:
+        _release(db, scope, claimed_at)
+        # Wake same-process duplicates without cancelling them along with us
+        future.set_result(None)
+        raise
+    except Exception as e:
+        _release(db, scope, claimed_at)
+        future.set_exception(e)
+        # Nobody may be waiting; retrieve the exception so asyncio doesn't warn
+        future.exception()
+        raise
+    finally:
+        del _inflight[scope]
@@ -12,6 +12,6 @@ class Test(Base):
     score = Column(Integer)
     rule_based_strength = Column(String, nullable=True)  # e.g., "Strong", "Moderate"
     ml_based_strength = Column(String, nullable=True)    # optional, if you want labels from ML
-    feedback = Column(String)
+    feedback = Column(JSON)
     created_at = Column(DateTime(timezone=True), server_default=func.now())  # Add this line
     completed_at = Column(DateTime(timezone=True), nullable=True)  # Add completion timestamp to measure duration
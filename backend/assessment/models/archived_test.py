@@ -0,0 +1,15 @@
+from sqlalchemy import Column, Integer, String, ForeignKey, DateTime
+from database.session import Base
+
+class ArchivedTest(Base):
+    """Index entry for a test moved out of ``tests`` into a compressed segment file."""
+    __tablename__ = "archived_tests"
+
+    test_id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id"), index=True)
+    segment = Column(String, nullable=False)       # file name inside ARCHIVE_DIR
+    block_offset = Column(Integer, nullable=False)  # byte offset of the compressed block
+    block_length = Column(Integer, nullable=False)
+    score = Column(Integer, nullable=True)
+    created_at = Column(DateTime, nullable=True)
+    archived_at = Column(DateTime, nullable=False)
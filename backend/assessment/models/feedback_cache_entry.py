@@ -0,0 +1,13 @@
+from sqlalchemy import Column, Integer, String, JSON, DateTime
+from database.session import Base
+
+class FeedbackCacheEntry(Base):
+    """Persistent tier of the AI feedback cache (see ``assessment/feedback_cache.py``)."""
+    __tablename__ = "feedback_cache"
+
+    key = Column(String(64), primary_key=True)
+    feedback = Column(JSON, nullable=False)
+    hits = Column(Integer, nullable=False, default=0)
+    created_at = Column(DateTime, nullable=False)
+    last_used_at = Column(DateTime, nullable=False, index=True)
+    expires_at = Column(DateTime, nullable=False, index=True)
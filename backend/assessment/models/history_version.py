@@ -0,0 +1,20 @@
+from sqlalchemy import Column, Integer, String, ForeignKey
+from database.session import Base
+
+class HistoryVersion(Base):
+    """Per-user counter bumped whenever a test is evaluated (drives test-history ETags)."""
+    __tablename__ = "history_versions"
+
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
+
+class HistoryEpoch(Base):
+    """Single row holding a random token minted once per database.
+
+    Test-history ETags include it, so ETags from a reset or different database
+    can never match again.
+    """
+    __tablename__ = "history_epoch"
+
+    id = Column(Integer, primary_key=True)
+    epoch = Column(String(32), nullable=False)
@@ -0,0 +1,18 @@
+from sqlalchemy import Column, Integer, String, LargeBinary, DateTime
+from database.session import Base
+
+class IdempotencyRecord(Base):
+    """Outcome of a request made with an ``Idempotency-Key`` header, kept until ``expires_at``."""
+    __tablename__ = "idempotency_records"
+
+    user_key = Column(String(100), primary_key=True)
+    endpoint = Column(String(50), primary_key=True)
+    key = Column(String(255), primary_key=True)
+    fingerprint = Column(String(64), nullable=False)
+    status = Column(String(20), nullable=False)  # "in_progress" or "completed"
+    status_code = Column(Integer, nullable=True)
+    media_type = Column(String(100), nullable=True)
+    body = Column(LargeBinary, nullable=True)
+    created_at = Column(DateTime, nullable=False)
+    claimed_at = Column(DateTime, nullable=False)  # lease start of the current in-progress owner
+    expires_at = Column(DateTime, nullable=False, index=True)
@@ -4,7 +4,9 @@ from datetime import datetime
 
 class Test(Base):
     __tablename__ = "tests"
-    
+    # Never reuse ids of deleted (archived) tests; archived_tests is keyed by test id
+    __table_args__ = {"sqlite_autoincrement": True}
+
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"))
     questions = Column(JSON)
@@ -12,6 +14,6 @@ class Test(Base):
     score = Column(Integer, nullable=True)
     rule_based_strength = Column(String, nullable=True)
     ml_based_strength = Column(String, nullable=True)
-    feedback = Column(String, nullable=True)
+    feedback = Column(JSON, nullable=True)
     created_at = Column(DateTime, default=datetime.utcnow)
     completed_at = Column(DateTime(timezone=True), nullable=True)
\ No newline at end of file
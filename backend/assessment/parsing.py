@@ -0,0 +1,11 @@
+import regex as re
+from typing import Optional
+
+# Balanced-brace match via recursion; LLM replies often wrap the JSON in prose
+JSON_OBJECT_PATTERN = re.compile(r"\{(?:[^{}]|(?R))*\}", re.DOTALL)
+
+def extract_json_from_string(text: str) -> Optional[str]:
+    json_match = JSON_OBJECT_PATTERN.search(text)
+    if json_match:
+        return json_match.group(0)
+    return None
@@ -18,4 +18,24 @@ Format as JSON with:
         }
     ]
 }
-"""
\ No newline at end of file
+"""
+FEEDBACK_PROMPT = """
+You are an expert educational psychologist. Return JSON-formatted structured feedback:
+
+{{
+    "overview": "summary of critical thinking skills",
+    "strengths": ["strength1", "strength2"],
+    "improvements": ["improvement1", "improvement2"]
+}}
+
+Score: {score} out of 100
+Details: {question_summaries}
+"""
+
+FEEDBACK_QUESTION_DETAIL = (
+    "\n\nQ{qid}: {text}\n"
+    "- User Answer: {user_answer}\n"
+    "- Correct Answer: {correct_answer}\n"
+    "- Explanation: {explanation}\n"
+    "- Result: {result}"
+)
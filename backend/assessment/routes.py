@@ -1,21 +1,43 @@
-import regex as re
 import json
 import os
 import logging
 from datetime import datetime
-from typing import Optional, Dict, List,Any
+from typing import Optional, Dict, List
 from sqlalchemy import desc
+import orjson
 import requests
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Header, Query, Response
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import ORJSONResponse, StreamingResponse
 from fastapi.security import OAuth2PasswordBearer
-from pydantic import BaseModel
 from sqlalchemy.orm import Session
 
 from .scoring import Scorer, StrengthEvaluator
-from .prompts import CRITICAL_THINKING_PROMPT
-from database.session import get_db
-from auth.security import get_current_user
+from .prompts import CRITICAL_THINKING_PROMPT, FEEDBACK_PROMPT, FEEDBACK_QUESTION_DETAIL
+from .parsing import extract_json_from_string
+from .schemas import (
+    TestResponse,
+    EvaluationResponse,
+    EvaluationRequest,
+    TestHistoryResponse,
+)
+from . import serialization
+from .admission import admission
+from . import archive
+from .idempotency import run_idempotent, fingerprint
+from .feedback_cache import feedback_cache, feedback_key
+from database.session import get_db, SessionLocal
+from auth.security import get_current_user, get_ops_user
 from assessment.models.test import Test
+from assessment.models.history_version import HistoryVersion
+from .history_cache import (
+    bump_history_version,
+    history_etag,
+    epoch_subquery,
+    ensure_database_epoch,
+    etag_matches,
+    history_body_cache,
+)
 from dotenv import load_dotenv
 
 
@@ -36,59 +58,52 @@ scorer = Scorer()
 
 OPENROUTER_API_KEY = os.getenv("OPENROUTER_API_KEY")
 OPENROUTER_URL = "https://openrouter.ai/api/v1/chat/completions"
+OPENROUTER_MODEL = "openai/gpt-3.5-turbo"
+
+@router.get("/admission-stats")
+async def get_admission_stats(current_user: dict = Depends(get_ops_user)):
+    return admission.stats()
+
+@router.get("/feedback-cache-stats")
+async def get_feedback_cache_stats(current_user: dict = Depends(get_ops_user)):
+    return feedback_cache.stats()
+
+@router.get("/export")
+async def export_tests(
+    codec: str = Query("gzip", pattern="^(gzip|zstd|none)$"),
+    user_id: Optional[int] = None,
+    before: Optional[datetime] = None,
+    include_archived: bool = False,
+    current_user: dict = Depends(get_ops_user),
+):
+    try:
+        archive.check_codec(codec)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    # tests stores naive UTC; an aware ?before=...Z would fail to compare mid-stream
+    before = archive.naive_utc(before)
+
+    def stream():
+        # The request's session is closed before the body is streamed, so use our own
+        db = SessionLocal()
+        try:
+            yield from archive.export_stream(
+                db, codec, before=before, user_id=user_id, include_archived=include_archived
+            )
+        finally:
+            db.close()
+
+    filename = f"tests-{datetime.utcnow():%Y%m%dT%H%M%S}{archive.EXTENSIONS[codec]}"
+    return StreamingResponse(
+        stream(),
+        media_type=archive.MEDIA_TYPES[codec],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
 
-class Question(BaseModel):
-    id: int
-    text: str
-    options: List[str]
-    correct_index: int
-    explanation: Optional[str] = None
-
-class TestResponse(BaseModel):
-    questions: List[Question]
-    test_id: int
-
-class StructuredFeedback(BaseModel):
-    overview: str
-    strengths: List[str]
-    improvements: List[str]
-
-class ScoreDetails(BaseModel):
-    value: float
-    max: float = 100.0
-    percentage: float
-    rule_based_strength: str  # "Strong", "Moderate", "Weak"
-    ml_based_strength: str    # "Strong", "Moderate", "Weak"
-
-class EvaluationResponse(BaseModel):
-    score: ScoreDetails
-    feedback: StructuredFeedback
-    detailed_feedback: Optional[Dict[int, str]] = None
-
-class EvaluationRequest(BaseModel):
-    test_id: int
-    answers: Dict[str, int]
-
-class TestHistoryItem(BaseModel):
-    id: int
-    score: float
-    rule_based_strength: str
-    ml_based_strength: str
-    created_at: datetime
-    completed_at: datetime
-    feedback: Optional[Dict[str, Any]] = None
-
-class TestHistoryResponse(BaseModel):
-    tests: List[TestHistoryItem]
-
-def extract_json_from_string(text: str) -> Optional[str]:
-    json_match = re.search(r"\{(?:[^{}]|(?R))*\}", text, re.DOTALL)
-    if json_match:
-        return json_match.group(0)
-    return None
-
-@router.get("/test-history", response_model=TestHistoryResponse)
-async def get_test_history(
+@router.get("/archived-tests/{test_id}")
+async def get_archived_test(
+    test_id: int,
     current_user: dict = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
@@ -97,31 +112,63 @@ async def get_test_history(
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
 
-    tests = db.query(Test).filter(
-        Test.user_id == user.id,
-        Test.score.isnot(None)
-    ).order_by(desc(Test.created_at)).all()
-
-    return TestHistoryResponse(
-        tests=[
-            TestHistoryItem(
-                id=test.id,
-                score=test.score,
-                rule_based_strength=test.rule_based_strength,
-                ml_based_strength=test.ml_based_strength,
-                created_at=test.created_at,
-                completed_at=test.completed_at,
-                feedback=json.loads(test.feedback) if test.feedback else None
-            )
-            for test in tests
-        ]
-    )
+    record = archive.load_archived_test(db, test_id)
+    if record is None or record["user_id"] != user.id:
+        raise HTTPException(status_code=404, detail="Archived test not found")
+    return record
+
+@router.get("/test-history", response_model=TestHistoryResponse)
+async def get_test_history(
+    limit: Optional[int] = Query(None, ge=1, le=100),
+    offset: int = Query(0, ge=0),
+    if_none_match: Optional[str] = Header(None),
+    current_user: dict = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    from auth.models import User
+    row = db.query(User.id, HistoryVersion.version, epoch_subquery().label("epoch")).outerjoin(
+        HistoryVersion, HistoryVersion.user_id == User.id
+    ).filter(User.email == current_user["username"]).first()
+    if not row:
+        raise HTTPException(status_code=404, detail="User not found")
+    user_id, version = row.id, row.version or 0
+    epoch = row.epoch or ensure_database_epoch(db)
+
+    etag = history_etag(epoch, user_id, version, offset, limit)
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
+
+    cache_key = (epoch, user_id, version, offset, limit)
+    body = history_body_cache.get(cache_key)
+    if body is None:
+        query = db.query(Test).filter(
+            Test.user_id == user_id,
+            Test.score.isnot(None)
+        ).order_by(desc(Test.created_at)).offset(offset)
+        if limit is not None:
+            query = query.limit(limit)
+        body = ORJSONResponse(serialization.history_response(query.all())).body
+        history_body_cache.put(cache_key, body)
+
+    return Response(content=body, media_type="application/json", headers=headers)
 
 @router.post("/generate-test", response_model=TestResponse)
 async def generate_test(
+    idempotency_key: Optional[str] = Header(None),
     current_user: dict = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
+    return await run_idempotent(
+        db,
+        current_user["username"],
+        "generate-test",
+        idempotency_key,
+        fingerprint(b""),
+        lambda: _generate_test(current_user, db),
+    )
+
+async def _generate_test(current_user: dict, db: Session) -> ORJSONResponse:
     if not OPENROUTER_API_KEY:
         logger.error("OPENROUTER_API_KEY is not set in environment variables!")
         raise HTTPException(
@@ -140,7 +187,7 @@ async def generate_test(
     }
 
     payload = {
-        "model": "openai/gpt-3.5-turbo",
+        "model": OPENROUTER_MODEL,
         "messages": [{"role": "user", "content": CRITICAL_THINKING_PROMPT}],
         "temperature": 0.7,
         "max_tokens": 2000
@@ -149,7 +196,10 @@ async def generate_test(
     logger.info(f"Sending payload to OpenRouter:\n{json.dumps(payload, indent=2)}")
 
     try:
-        response = requests.post(OPENROUTER_URL, headers=headers, json=payload, timeout=30)
+        async with admission.slot(current_user["username"], OPENROUTER_MODEL):
+            response = await run_in_threadpool(
+                requests.post, OPENROUTER_URL, headers=headers, json=payload, timeout=30
+            )
         logger.info(f"OpenRouter response status code: {response.status_code}")
         logger.info(f"OpenRouter response text:\n{response.text}")
     except requests.exceptions.RequestException as e:
@@ -158,7 +208,12 @@ async def generate_test(
 
     if response.status_code != 200:
         logger.error(f"OpenRouter API returned error status: {response.status_code}")
-        raise HTTPException(status_code=response.status_code, detail="OpenRouter API error")
+        retry_after = response.headers.get("Retry-After")
+        raise HTTPException(
+            status_code=response.status_code,
+            detail="OpenRouter API error",
+            headers={"Retry-After": retry_after} if retry_after else None,
+        )
 
     try:
         data = response.json()
@@ -188,18 +243,16 @@ async def generate_test(
         if not all(k in q for k in ["text", "options", "correct_index"]):
             logger.error(f"Question missing required fields: {q}")
             raise HTTPException(status_code=422, detail="Question missing required fields")
-        questions.append(Question(
-            id=idx,
-            text=q["text"],
-            options=q["options"],
-            correct_index=q["correct_index"],
-            explanation=q.get("explanation", "")
-        ))
+        try:
+            questions.append(serialization.question_dict(idx, q))
+        except (TypeError, ValueError) as e:
+            logger.error(f"Question has invalid field types: {q} ({e})")
+            raise HTTPException(status_code=422, detail="Question has invalid field types")
 
     try:
         test = Test(
             user_id=user.id,
-            questions=[q.dict() for q in questions],
+            questions=questions,
             created_at= datetime.utcnow(),
         )
         db.add(test)
@@ -212,13 +265,15 @@ async def generate_test(
 
     logger.info(f"Test generated successfully with ID: {test.id}")
 
-    return TestResponse(
-        questions=questions,
-        test_id=test.id,
-    )
+    return ORJSONResponse(serialization.test_response(test.id, questions))
 
 
-async def generate_ai_feedback(score: float, questions: List[dict], answers: Dict[int, int]) -> dict:
+async def generate_ai_feedback(
+    score: float,
+    questions: List[dict],
+    answers: Dict[int, int],
+    user_key: str,
+) -> dict:
     if not OPENROUTER_API_KEY:
         return {
             "overview": "Feedback service currently unavailable.",
@@ -226,56 +281,61 @@ async def generate_ai_feedback(score: float, questions: List[dict], answers: Dic
             "improvements": []
         }
 
+    cache_key = feedback_key(questions, answers, score, OPENROUTER_MODEL)
+    cached = feedback_cache.get(cache_key)
+    if cached is not None:
+        return cached
+
     question_summaries = ""
     for q in questions:
         qid = q["id"]
         user_answer = answers.get(qid, -1)
         correct = q["correct_index"]
-        explanation = q.get("explanation", "No explanation provided.")
-        question_summaries += (
-            f"\n\nQ{qid}: {q['text']}\n"
-            f"- User Answer: {q['options'][user_answer] if 0 <= user_answer < len(q['options']) else 'Invalid'}\n"
-            f"- Correct Answer: {q['options'][correct]}\n"
-            f"- Explanation: {explanation}\n"
-            f"- Result: {'Correct' if user_answer == correct else 'Incorrect'}"
+        question_summaries += FEEDBACK_QUESTION_DETAIL.format(
+            qid=qid,
+            text=q["text"],
+            user_answer=q["options"][user_answer] if 0 <= user_answer < len(q["options"]) else "Invalid",
+            correct_answer=q["options"][correct],
+            explanation=q.get("explanation", "No explanation provided."),
+            result="Correct" if user_answer == correct else "Incorrect",
         )
 
-    prompt = f"""
-You are an expert educational psychologist. Return JSON-formatted structured feedback:
-
-{{
-    "overview": "summary of critical thinking skills",
-    "strengths": ["strength1", "strength2"],
-    "improvements": ["improvement1", "improvement2"]
-}}
-
-Score: {score} out of 100
-Details: {question_summaries}
-"""
+    prompt = FEEDBACK_PROMPT.format(score=score, question_summaries=question_summaries)
 
     try:
-        response = requests.post(
-            OPENROUTER_URL,
-            headers={
-                "Authorization": f"Bearer {OPENROUTER_API_KEY}",
-                "Content-Type": "application/json"
-            },
-            json={
-                "model": "openai/gpt-3.5-turbo",
-                "messages": [{"role": "user", "content": prompt}],
-                "temperature": 0.7,
-                "max_tokens": 800
-            },
-            timeout=30
-        )
+        # Only actual LLM calls go through admission; cache hits above skip it
+        async with admission.slot(user_key, OPENROUTER_MODEL):
+            response = await run_in_threadpool(
+                requests.post,
+                OPENROUTER_URL,
+                headers={
+                    "Authorization": f"Bearer {OPENROUTER_API_KEY}",
+                    "Content-Type": "application/json"
+                },
+                json={
+                    "model": OPENROUTER_MODEL,
+                    "messages": [{"role": "user", "content": prompt}],
+                    "temperature": 0.7,
+                    "max_tokens": 800
+                },
+                timeout=30
+            )
         response.raise_for_status()
         content = response.json()["choices"][0]["message"]["content"]
         json_str = extract_json_from_string(content)
-        return json.loads(json_str) if json_str else {
-            "overview": "Could not parse feedback",
-            "strengths": [],
-            "improvements": []
-        }
+        try:
+            if not json_str:
+                raise ValueError("no JSON object in feedback reply")
+            feedback = serialization.normalize_feedback(json.loads(json_str))
+        except ValueError as e:
+            logger.error(f"Could not parse AI feedback: {e}")
+            return {
+                "overview": "Could not parse feedback",
+                "strengths": [],
+                "improvements": []
+            }
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Failed to generate AI feedback: {e}")
         return {
@@ -284,13 +344,31 @@ Details: {question_summaries}
             "improvements": []
         }
 
+    feedback_cache.put(cache_key, feedback)
+    return feedback
+
 
 @router.post("/evaluate-test", response_model=EvaluationResponse)
 async def evaluate_test(
     request: EvaluationRequest,
+    idempotency_key: Optional[str] = Header(None),
     current_user: dict = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
+    request_fingerprint = fingerprint(orjson.dumps(
+        {"test_id": request.test_id, "answers": request.answers},
+        option=orjson.OPT_SORT_KEYS,
+    ))
+    return await run_idempotent(
+        db,
+        current_user["username"],
+        "evaluate-test",
+        idempotency_key,
+        request_fingerprint,
+        lambda: _evaluate_test(request, current_user, db),
+    )
+
+async def _evaluate_test(request: EvaluationRequest, current_user: dict, db: Session) -> ORJSONResponse:
     from auth.models import User
     user = db.query(User).filter(User.email == current_user["username"]).first()
     if not user:
@@ -311,30 +389,29 @@ async def evaluate_test(
         rule_strength = strength_evaluator.predict_rule_strength(score, duration)
         ml_strength = strength_evaluator.predict_ml_strength(score, duration)
 
-        ai_feedback = await generate_ai_feedback(score, test.questions, int_answers)
+        ai_feedback = await generate_ai_feedback(
+            score, test.questions, int_answers, current_user["username"]
+        )
 
         test.answers = int_answers
         test.score = score
         test.rule_based_strength = rule_strength
         test.ml_based_strength = ml_strength
-        test.feedback = json.dumps(ai_feedback)
+        test.feedback = ai_feedback
         test.completed_at = datetime.utcnow()
+        bump_history_version(db, user.id)
         db.commit()
 
-        return EvaluationResponse(
-            score={
-                "value": score,
-                "max": 100,
-                "percentage": score,
-                "rule_based_strength": rule_strength,
-                "ml_based_strength": ml_strength
-            },
-            feedback=ai_feedback,
-            detailed_feedback={
-                q["id"]: f"Your answer: {q['options'][int_answers.get(q['id'], -1)]}. Correct: {q['options'][q['correct_index']]}"
-                for q in test.questions
-            }
-        )
+        return ORJSONResponse(serialization.evaluation_response(
+            score,
+            rule_strength,
+            ml_strength,
+            ai_feedback,
+            serialization.detailed_feedback(test.questions, int_answers),
+        ))
+    except HTTPException:
+        db.rollback()
+        raise
     except Exception as e:
         db.rollback()
         logger.error(f"Evaluation failed: {e}")
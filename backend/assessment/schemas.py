@@ -0,0 +1,47 @@
+from datetime import datetime
+from typing import Optional, Dict, List, Any
+from pydantic import BaseModel
+
+class Question(BaseModel):
+    id: int
+    text: str
+    options: List[str]
+    correct_index: int
+    explanation: Optional[str] = None
+
+class TestResponse(BaseModel):
+    questions: List[Question]
+    test_id: int
+
+class StructuredFeedback(BaseModel):
+    overview: str
+    strengths: List[str]
+    improvements: List[str]
+
+class ScoreDetails(BaseModel):
+    value: float
+    max: float = 100.0
+    percentage: float
+    rule_based_strength: str  # "Strong", "Moderate", "Weak"
+    ml_based_strength: str    # "Strong", "Moderate", "Weak"
+
+class EvaluationResponse(BaseModel):
+    score: ScoreDetails
+    feedback: StructuredFeedback
+    detailed_feedback: Optional[Dict[int, str]] = None
+
+class EvaluationRequest(BaseModel):
+    test_id: int
+    answers: Dict[str, int]
+
+class TestHistoryItem(BaseModel):
+    id: int
+    score: float
+    rule_based_strength: str
+    ml_based_strength: str
+    created_at: datetime
+    completed_at: datetime
+    feedback: Optional[Dict[str, Any]] = None
+
+class TestHistoryResponse(BaseModel):
+    tests: List[TestHistoryItem]
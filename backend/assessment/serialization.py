@@ -0,0 +1,105 @@
+"""Plain-dict builders for the hot assessment responses.
+
+The endpoints wrap these in an ``ORJSONResponse`` and return it directly, so
+FastAPI skips re-validating the payload against the route's ``response_model``
+(the models in ``schemas.py`` still document the shape in OpenAPI).
+"""
+from typing import Dict, List, Optional
+
+
+def question_dict(idx: int, raw: dict) -> dict:
+    """Validate an LLM-generated question as strictly as ``schemas.Question`` would.
+
+    Raises ``ValueError`` on malformed fields rather than coercing them.
+    """
+    text, options, correct_index = raw["text"], raw["options"], raw["correct_index"]
+    explanation = raw.get("explanation", "")
+    if not isinstance(text, str):
+        raise ValueError("text must be a string")
+    if not isinstance(options, list) or not all(isinstance(o, str) for o in options):
+        raise ValueError("options must be a list of strings")
+    if isinstance(correct_index, bool) or not isinstance(correct_index, int):
+        raise ValueError("correct_index must be an integer")
+    if explanation is not None and not isinstance(explanation, str):
+        raise ValueError("explanation must be a string or null")
+    return {
+        "id": idx,
+        "text": text,
+        "options": options,
+        "correct_index": correct_index,
+        "explanation": explanation,
+    }
+
+
+def test_response(test_id: int, questions: List[dict]) -> dict:
+    return {"questions": questions, "test_id": test_id}
+
+
+def history_item(test) -> dict:
+    return {
+        "id": test.id,
+        "score": float(test.score),
+        "rule_based_strength": test.rule_based_strength,
+        "ml_based_strength": test.ml_based_strength,
+        "created_at": test.created_at,
+        "completed_at": test.completed_at,
+        "feedback": test.feedback or None,
+    }
+
+
+def history_response(tests) -> dict:
+    return {"tests": [history_item(test) for test in tests]}
+
+
+def detailed_feedback(questions: List[dict], answers: Dict[int, int]) -> Dict[int, str]:
+    return {
+        q["id"]: f"Your answer: {q['options'][answers.get(q['id'], -1)]}. Correct: {q['options'][q['correct_index']]}"
+        for q in questions
+    }
+
+
+def evaluation_response(
+    score: float,
+    rule_strength: str,
+    ml_strength: str,
+    feedback: dict,
+    details: Optional[Dict[int, str]] = None,
+) -> dict:
+    return {
+        "score": {
+            "value": float(score),
+            "max": 100.0,
+            "percentage": float(score),
+            "rule_based_strength": str(rule_strength),
+            "ml_based_strength": str(ml_strength),
+        },
+        "feedback": feedback,
+        "detailed_feedback": details,
+    }
+
+
+def _feedback_items(value) -> List[str]:
+    if value is None:
+        return []
+    if isinstance(value, str):
+        return [value]  # a lone item the LLM forgot to wrap in a list
+    if not isinstance(value, list) or not all(isinstance(item, str) for item in value):
+        raise ValueError("feedback items must be a string or a list of strings")
+    return value
+
+
+def normalize_feedback(raw) -> dict:
+    """Validate LLM feedback into the ``StructuredFeedback`` shape once, at the boundary.
+
+    Raises ``ValueError`` for anything that cannot be read as that shape.
+    """
+    if not isinstance(raw, dict):
+        raise ValueError("feedback must be a JSON object")
+    overview = raw.get("overview")
+    if overview is not None and not isinstance(overview, str):
+        raise ValueError("overview must be a string")
+    return {
+        "overview": overview or "",
+        "strengths": _feedback_items(raw.get("strengths")),
+        "improvements": _feedback_items(raw.get("improvements")),
+    }
@@ -2,6 +2,7 @@
 from passlib.context import CryptContext
 from datetime import datetime, timedelta
 from typing import Optional
+import os
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 from jose import JWTError, jwt
@@ -46,4 +47,17 @@ async def get_current_user(token: str = Depends(oauth2_scheme)):
     except JWTError:
         raise credentials_exception
     
-    return {"username": username}
\ No newline at end of file
+    return {"username": username}
+
+# Comma-separated emails allowed to use operational endpoints (exports etc.)
+OPS_USER_EMAILS = {
+    email.strip() for email in os.getenv("OPS_USER_EMAILS", "").split(",") if email.strip()
+}
+
+async def get_ops_user(current_user: dict = Depends(get_current_user)):
+    if current_user["username"] not in OPS_USER_EMAILS:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Operator access required",
+        )
+    return current_user
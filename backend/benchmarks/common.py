@@ -0,0 +1,57 @@
+import json
+import platform
+import sys
+import time
+from typing import Callable, List, Optional
+
+
+def measure(name: str, fn: Callable[[], object], repeat: int = 5, number: int = 1000) -> dict:
+    """Time ``fn`` and return per-call statistics in microseconds (best of ``repeat``)."""
+    fn()  # warm-up
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            fn()
+        samples.append((time.perf_counter() - start) / number * 1e6)
+    samples.sort()
+    return {
+        "name": name,
+        "number": number,
+        "repeat": repeat,
+        "best_us": round(samples[0], 3),
+        "median_us": round(samples[len(samples) // 2], 3),
+    }
+
+
+def report(results: List[dict], as_json: bool = False, output: Optional[str] = None) -> None:
+    if as_json or output:
+        document = {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "results": results,
+        }
+        if output:
+            with open(output, "w") as fh:
+                json.dump(document, fh, indent=2)
+        else:
+            json.dump(document, sys.stdout, indent=2)
+            sys.stdout.write("\n")
+            return
+    width = max(len(r["name"]) for r in results)
+    for r in results:
+        print(f"{r['name']:<{width}}  best {r['best_us']:>10.2f} us  median {r['median_us']:>10.2f} us")
+
+
+def find_regressions(results: List[dict], baseline_path: str, tolerance: float) -> List[str]:
+    """Compare best times against a saved ``report`` file; list cases slower than ``1 + tolerance``."""
+    with open(baseline_path) as fh:
+        baseline = {r["name"]: r for r in json.load(fh)["results"]}
+    regressions = []
+    for r in results:
+        before = baseline.get(r["name"])
+        if before and r["best_us"] > before["best_us"] * (1 + tolerance):
+            regressions.append(
+                f"{r['name']}: {before['best_us']:.2f} us -> {r['best_us']:.2f} us"
+            )
+    return regressions
@@ -0,0 +1,142 @@
+"""Micro-benchmarks for the CPU-side scoring and strength pipeline.
+
+Covers ``Scorer.calculate_score``, ``StrengthEvaluator.predict_rule_strength`` /
+``predict_ml_strength``, the per-question ``detailed_feedback`` map built by
+``evaluate_test`` and ``extract_json_from_string``. Fixtures range from the
+production 5-question test up to many questions with oversized answer maps.
+
+Run from the backend directory (the ML model files are loaded from there)::
+
+    python -m benchmarks.hot_path --output bench.json
+    python -m benchmarks.hot_path --baseline bench.json --tolerance 0.25
+
+With ``--baseline`` the run exits non-zero when any case is slower than the
+saved result by more than ``--tolerance``.
+"""
+import argparse
+import contextlib
+import json
+import random
+import sys
+
+from assessment.parsing import extract_json_from_string
+from assessment.scoring import Scorer
+from assessment.serialization import detailed_feedback, question_dict
+from benchmarks.common import find_regressions, measure, report
+
+QUESTION_COUNTS = (5, 50, 500)
+# Extra answer keys per question: clients may send stale or unknown ids
+ANSWER_MAP_FACTOR = 10
+
+
+def make_questions(count: int, rng: random.Random) -> list:
+    return [
+        question_dict(idx, {
+            "text": f"Scenario {idx}: a council argues that because crime fell after "
+                    f"street lights were installed, the lights caused the fall. "
+                    f"Which assumption does the argument rely on?",
+            "options": [f"Option {c}: a plausible but distinct reading of the data" for c in "ABCD"],
+            "correct_index": rng.randrange(4),
+            "explanation": "Correlation alone does not establish causation.",
+        })
+        for idx in range(1, count + 1)
+    ]
+
+
+def make_answers(questions: list, rng: random.Random, extra: int = 0) -> dict:
+    answers = {q["id"]: rng.randrange(4) for q in questions}
+    first_unknown = len(questions) + 1
+    for qid in range(first_unknown, first_unknown + extra):
+        answers[qid] = rng.randrange(4)
+    return answers
+
+
+def make_llm_reply(questions: list) -> str:
+    payload = {"questions": [
+        {k: q[k] for k in ("text", "options", "correct_index", "explanation")}
+        for q in questions
+    ]}
+    return (
+        "Sure! Here are the questions you asked for:\n\n"
+        f"```json\n{json.dumps(payload, indent=2)}\n```\n"
+        "Let me know if you would like more {or fewer} questions."
+    )
+
+
+def run(seed: int = 42) -> list:
+    rng = random.Random(seed)
+    scorer = Scorer()
+    evaluator = scorer.strength_evaluator
+    results = []
+
+    for count in QUESTION_COUNTS:
+        questions = make_questions(count, rng)
+        answers = make_answers(questions, rng)
+        large_answers = make_answers(questions, rng, extra=count * ANSWER_MAP_FACTOR)
+        number = max(10, 20000 // count)
+
+        results.append(measure(
+            f"calculate_score q={count}",
+            lambda: scorer.calculate_score(questions, answers),
+            number=number,
+        ))
+        results.append(measure(
+            f"calculate_score q={count} large_answers",
+            lambda: scorer.calculate_score(questions, large_answers),
+            number=number,
+        ))
+        results.append(measure(
+            f"detailed_feedback q={count}",
+            lambda: detailed_feedback(questions, answers),
+            number=number,
+        ))
+
+        reply = make_llm_reply(questions)
+        results.append(measure(
+            f"extract_json_from_string q={count}",
+            lambda: extract_json_from_string(reply),
+            number=max(5, 2000 // count),
+        ))
+
+    samples = [(rng.uniform(0, 100), rng.uniform(60, 900)) for _ in range(256)]
+    cycle = iter(())
+
+    def next_sample():
+        nonlocal cycle
+        try:
+            return next(cycle)
+        except StopIteration:
+            cycle = iter(samples)
+            return next(cycle)
+
+    results.append(measure(
+        "predict_rule_strength",
+        lambda: evaluator.predict_rule_strength(*next_sample()),
+        number=20000,
+    ))
+    results.append(measure(
+        "predict_ml_strength",
+        lambda: evaluator.predict_ml_strength(*next_sample()),
+        number=200,
+    ))
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--json", action="store_true", help="emit machine-readable results on stdout")
+    parser.add_argument("--output", help="write machine-readable results to this file")
+    parser.add_argument("--baseline", help="results file from a previous run to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed slowdown vs. baseline")
+    args = parser.parse_args()
+
+    # StrengthEvaluator prints while loading; keep stdout clean for --json
+    with contextlib.redirect_stdout(sys.stderr):
+        results = run(args.seed)
+    report(results, as_json=args.json, output=args.output)
+    if args.baseline:
+        regressions = find_regressions(results, args.baseline, args.tolerance)
+        for line in regressions:
+            print(f"REGRESSION {line}", file=sys.stderr)
+        sys.exit(1 if regressions else 0)
@@ -0,0 +1,103 @@
+"""Serialization cost per assessment endpoint: validated pydantic path vs. direct ORJSON.
+
+The "pydantic" case mirrors what FastAPI does for a returned model with a
+``response_model``: build the model, re-validate it, ``jsonable_encoder`` it and
+dump with the stdlib encoder. The "orjson" case is what the routes do now.
+
+Run from the backend directory: ``python -m benchmarks.serialization [--json]``
+"""
+import argparse
+import json
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+import orjson
+from fastapi.encoders import jsonable_encoder
+
+from assessment import serialization
+from assessment.schemas import EvaluationResponse, TestHistoryResponse, TestResponse
+from benchmarks.common import measure, report
+
+ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+
+
+def make_questions(count: int = 5) -> list:
+    return [
+        serialization.question_dict(idx, {
+            "text": f"Scenario {idx}: " + "a fairly long argument to analyse " * 8,
+            "options": [f"Option {c} for question {idx}" for c in "ABCD"],
+            "correct_index": idx % 4,
+            "explanation": "Because the premise does not support the conclusion. " * 3,
+        })
+        for idx in range(1, count + 1)
+    ]
+
+
+def make_feedback() -> dict:
+    return {
+        "overview": "Solid reasoning with room to improve on implicit assumptions. " * 4,
+        "strengths": ["Identifies logical fallacies", "Weighs evidence carefully"],
+        "improvements": ["Question hidden assumptions", "Consider alternative explanations"],
+    }
+
+
+def make_history(count: int = 50) -> list:
+    now = datetime.utcnow()
+    return [
+        SimpleNamespace(
+            id=i,
+            score=(i * 20) % 101,
+            rule_based_strength="Moderate",
+            ml_based_strength="Moderate",
+            created_at=now - timedelta(days=i, minutes=10),
+            completed_at=now - timedelta(days=i),
+            feedback=make_feedback(),
+        )
+        for i in range(count)
+    ]
+
+
+def _validated(model, payload: dict) -> bytes:
+    # FastAPI validates the returned object against response_model, then encodes it
+    validated = model.model_validate(payload) if hasattr(model, "model_validate") else model.parse_obj(payload)
+    return json.dumps(jsonable_encoder(validated)).encode("utf-8")
+
+
+def run(history_size: int = 50, question_count: int = 5) -> list:
+    questions = make_questions(question_count)
+    answers = {q["id"]: 0 for q in questions}
+    history = make_history(history_size)
+
+    generate = serialization.test_response(1, questions)
+    evaluate = serialization.evaluation_response(
+        80.0, "Strong", "Strong", make_feedback(),
+        serialization.detailed_feedback(questions, answers),
+    )
+    # Legacy history rows held feedback as a JSON string decoded per row
+    legacy_rows = [dict(vars(t), feedback=json.dumps(t.feedback)) for t in history]
+
+    def legacy_history():
+        tests = [dict(row, feedback=json.loads(row["feedback"])) for row in legacy_rows]
+        return _validated(TestHistoryResponse, {"tests": tests})
+
+    return [
+        measure("generate-test pydantic", lambda: _validated(TestResponse, generate)),
+        measure("generate-test orjson", lambda: orjson.dumps(generate, option=ORJSON_OPTIONS)),
+        measure("evaluate-test pydantic", lambda: _validated(EvaluationResponse, evaluate)),
+        measure("evaluate-test orjson", lambda: orjson.dumps(evaluate, option=ORJSON_OPTIONS)),
+        measure("test-history pydantic", legacy_history, number=200),
+        measure(
+            "test-history orjson",
+            lambda: orjson.dumps(serialization.history_response(history), option=ORJSON_OPTIONS),
+            number=200,
+        ),
+    ]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--history-size", type=int, default=50)
+    parser.add_argument("--questions", type=int, default=5)
+    parser.add_argument("--json", action="store_true", help="emit machine-readable results")
+    args = parser.parse_args()
+    report(run(args.history_size, args.questions), as_json=args.json)
@@ -1,8 +1,10 @@
 from fastapi import FastAPI, Depends, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse
 from auth.routes import router as auth_router
 from assessment.routes import router as assessment_router
 from database.session import SessionLocal, engine, Base
+from profiling import install_profiling
 import logging
 from dotenv import load_dotenv
 import os
@@ -11,7 +13,7 @@ import os
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-app = FastAPI()
+app = FastAPI(default_response_class=ORJSONResponse)
 # Load environment variables first
 load_dotenv()
 # Enhanced CORS Configuration
@@ -72,6 +74,7 @@ async def log_requests(request: Request, call_next):
     except Exception as e:
         logger.error(f"Request failed: {str(e)}")
         raise
+install_profiling(app)
 app.include_router(auth_router, prefix="/auth")
 app.include_router(assessment_router, prefix="/assessment")
 
@@ -0,0 +1,68 @@
+"""One-off migration: store ``tests.feedback`` as a native JSON column.
+
+Feedback used to be ``json.dumps``-ed into a String column. Rows written that
+way are already valid JSON text, so SQLite (which has no real JSON type) reads
+them through the new ``JSON`` column as-is. This script only repairs rows whose
+value is not a well-formed feedback object. Double-encoded objects are decoded
+and normalised; anything that is not a feedback object is set to NULL rather
+than turned into invented feedback text. On PostgreSQL it also converts the
+column type.
+
+Run from the backend directory: ``python migrate_feedback_json.py``
+"""
+import json
+from sqlalchemy import text
+from database.session import engine
+from assessment.serialization import normalize_feedback
+
+UNCHANGED = object()
+
+
+def _repair(raw):
+    """Return the repaired JSON text for ``raw`` (None for SQL NULL), or UNCHANGED."""
+    try:
+        value = json.loads(raw)
+    except (TypeError, ValueError):
+        return None
+    # Double-encoded rows decode to a string holding the real payload
+    if isinstance(value, str):
+        try:
+            value = json.loads(value)
+        except ValueError:
+            return None
+    try:
+        normalized = normalize_feedback(value)
+    except ValueError:
+        return None
+    if normalized == json.loads(raw):
+        return UNCHANGED
+    return json.dumps(normalized)
+
+
+def migrate():
+    repaired = 0
+    with engine.begin() as conn:
+        rows = conn.execute(
+            text("SELECT id, feedback FROM tests WHERE feedback IS NOT NULL")
+        ).fetchall()
+        for test_id, raw in rows:
+            if not isinstance(raw, str):
+                continue  # already a native JSON value (PostgreSQL json column)
+            fixed = _repair(raw)
+            if fixed is not UNCHANGED:
+                conn.execute(
+                    text("UPDATE tests SET feedback = :feedback WHERE id = :id"),
+                    {"feedback": fixed, "id": test_id},
+                )
+                repaired += 1
+
+        if engine.dialect.name == "postgresql":
+            conn.execute(text(
+                "ALTER TABLE tests ALTER COLUMN feedback TYPE JSON USING feedback::json"
+            ))
+    return repaired
+
+
+if __name__ == "__main__":
+    count = migrate()
+    print(f"✅ Feedback migration complete - {count} row(s) repaired")
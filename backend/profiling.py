@@ -0,0 +1,74 @@
+"""Opt-in per-request sampling profiler.
+
+``PROFILING`` selects the mode:
+    off     (default) no profiling middleware is installed at all
+    header  profile requests that send ``X-Profile: 1``
+    all     profile every request
+
+Each profiled request is written to ``PROFILE_DIR`` as a speedscope JSON file.
+Open it at https://www.speedscope.app for a flamegraph view. The file name is
+returned in the ``X-Profile-File`` response header. ``PROFILE_INTERVAL`` sets
+the sampling interval in seconds. Needs the optional ``pyinstrument`` package.
+"""
+import logging
+import os
+import re
+import time
+
+from fastapi import FastAPI, Request
+
+try:
+    from pyinstrument import Profiler
+    from pyinstrument.renderers import SpeedscopeRenderer
+except ImportError:  # optional dependency
+    Profiler = None
+
+logger = logging.getLogger(__name__)
+
+PROFILING = os.getenv("PROFILING", "off").lower()
+PROFILE_DIR = os.getenv("PROFILE_DIR", "/app/db/profiles")
+PROFILE_INTERVAL = float(os.getenv("PROFILE_INTERVAL", "0.001"))
+PROFILE_HEADER = "x-profile"
+
+
+def _profile_path(request: Request) -> str:
+    slug = re.sub(r"[^A-Za-z0-9]+", "-", request.url.path).strip("-") or "root"
+    name = f"{int(time.time() * 1000)}-{request.method}-{slug}.speedscope.json"
+    return os.path.join(PROFILE_DIR, name)
+
+
+async def profile_requests(request: Request, call_next):
+    if PROFILING != "all" and request.headers.get(PROFILE_HEADER) != "1":
+        return await call_next(request)
+
+    profiler = Profiler(interval=PROFILE_INTERVAL, async_mode="enabled")
+    profiler.start()
+    try:
+        response = await call_next(request)
+    finally:
+        profiler.stop()
+        path = _profile_path(request)
+        try:
+            os.makedirs(PROFILE_DIR, exist_ok=True)
+            with open(path, "w") as fh:
+                fh.write(profiler.output(renderer=SpeedscopeRenderer()))
+            logger.info(f"Wrote request profile to {path}")
+        except OSError as e:
+            logger.error(f"Failed to write request profile: {e}")
+            path = None
+
+    if path:
+        response.headers["X-Profile-File"] = os.path.basename(path)
+    return response
+
+
+def install_profiling(app: FastAPI) -> None:
+    if PROFILING == "off":
+        return
+    if PROFILING not in ("header", "all"):
+        raise RuntimeError(f"Invalid PROFILING mode: {PROFILING!r}")
+    if Profiler is None:
+        logger.warning("PROFILING is set but pyinstrument is not installed; profiling disabled")
+        return
+    app.middleware("http")(profile_requests)
+    logger.info(f"Request profiling enabled (mode={PROFILING}, output={PROFILE_DIR})")
@@ -0,0 +1,9 @@
+import os
+import sys
+import tempfile
+
+# Run against a throwaway SQLite file; must be set before database.session is imported
+os.environ.setdefault(
+    "DATABASE_URL", f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'test.db')}"
+)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
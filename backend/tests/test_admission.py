@@ -0,0 +1,91 @@
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+
+from assessment.admission import AdmissionController
+
+
+async def call(controller, user="u", model="m", duration=0.0):
+    async with controller.slot(user, model):
+        await asyncio.sleep(duration)
+    return "ok"
+
+
+def run_all(*coroutines):
+    async def scenario():
+        return await asyncio.gather(*coroutines, return_exceptions=True)
+    return asyncio.run(scenario())
+
+
+def test_idle_server_admits_even_with_no_queue():
+    controller = AdmissionController(max_queue=0)
+    assert asyncio.run(call(controller)) == "ok"
+
+
+def test_busy_server_without_queue_sheds_and_refunds_token():
+    controller = AdmissionController(per_model_concurrency=1, max_queue=0, user_burst=1)
+
+    async def scenario():
+        holder = asyncio.create_task(call(controller, user="other", duration=0.2))
+        await asyncio.sleep(0.01)
+        with pytest.raises(HTTPException) as exc:
+            await call(controller, user="u")
+        await holder
+        # The shed request's token was refunded, so the user is not rate limited now
+        return exc.value, await call(controller, user="u")
+
+    shed, after = asyncio.run(scenario())
+    assert shed.status_code == 429 and shed.headers["Retry-After"] == "1"
+    assert after == "ok"
+    assert controller.stats()["shed"] == {"queue_full": 1}
+
+
+def test_deadline_not_estimated_before_first_call():
+    controller = AdmissionController(max_concurrency=2, max_wait=2)
+    results = run_all(*[call(controller, user=f"u{i}", duration=0.1) for i in range(6)])
+    assert results == ["ok"] * 6
+    assert controller.avg_service_seconds == pytest.approx(0.1, abs=0.05)
+
+
+def test_deadline_estimate_counts_global_contention():
+    controller = AdmissionController(max_concurrency=1, per_model_concurrency=1, max_wait=1)
+    controller.avg_service_seconds = 10.0
+
+    async def scenario():
+        holder = asyncio.create_task(call(controller, user="a", model="m1", duration=0.1))
+        await asyncio.sleep(0.01)
+        # A different model's slot is free, but the only global slot is taken
+        with pytest.raises(HTTPException) as exc:
+            await call(controller, user="b", model="m2")
+        await holder
+        return exc.value
+
+    shed = asyncio.run(scenario())
+    assert shed.status_code == 429 and int(shed.headers["Retry-After"]) >= 10
+    assert controller.stats()["shed"] == {"deadline": 1}
+
+
+def test_waiter_timing_out_is_shed_and_refunded():
+    controller = AdmissionController(per_model_concurrency=1, max_wait=0.1, user_burst=1)
+
+    async def scenario():
+        holder = asyncio.create_task(call(controller, user="other", duration=0.3))
+        await asyncio.sleep(0.01)
+        with pytest.raises(HTTPException) as exc:
+            await call(controller, user="u")
+        await holder
+        return exc.value, await call(controller, user="u")
+
+    shed, after = asyncio.run(scenario())
+    assert shed.status_code == 429
+    assert after == "ok"
+    assert controller.stats()["queue_depth"] == 0
+
+
+def test_rate_limited_user_gets_refill_retry_after():
+    controller = AdmissionController(user_rate_per_min=6, user_burst=1)
+    assert asyncio.run(call(controller)) == "ok"
+    with pytest.raises(HTTPException) as exc:
+        asyncio.run(call(controller))
+    assert exc.value.headers["Retry-After"] == "10"
@@ -0,0 +1,150 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi import HTTPException
+from fastapi.responses import ORJSONResponse
+
+import auth.models  # noqa: F401  registers ``users`` for foreign keys
+from assessment import idempotency
+from assessment.idempotency import fingerprint, run_idempotent
+from assessment.models.idempotency_record import IdempotencyRecord
+from database.session import Base, SessionLocal, engine
+
+
+@pytest.fixture(autouse=True)
+def clean_db():
+    Base.metadata.create_all(bind=engine)
+    yield
+    db = SessionLocal()
+    db.query(IdempotencyRecord).delete()
+    db.commit()
+    db.close()
+
+
+@pytest.fixture
+def session():
+    sessions = []
+
+    def open_session():
+        db = SessionLocal()
+        sessions.append(db)
+        return db
+
+    yield open_session
+    for db in sessions:
+        db.close()
+
+
+def counting_handler(calls, body, delay=0.0):
+    async def handler():
+        calls.append(body)
+        await asyncio.sleep(delay)
+        return ORJSONResponse({"body": body})
+    return handler
+
+
+def test_concurrent_duplicate_with_different_body_is_rejected(session):
+    calls = []
+
+    async def scenario():
+        return await asyncio.gather(
+            run_idempotent(session(), "u", "evaluate-test", "k", fingerprint(b"A"),
+                           counting_handler(calls, "A", delay=0.1)),
+            run_idempotent(session(), "u", "evaluate-test", "k", fingerprint(b"B"),
+                           counting_handler(calls, "B")),
+            return_exceptions=True,
+        )
+
+    first, second = asyncio.run(scenario())
+    assert first.status_code == 200
+    assert isinstance(second, HTTPException) and second.status_code == 422
+    assert calls == ["A"]
+
+
+def test_concurrent_duplicate_with_same_body_replays_first_result(session):
+    calls = []
+
+    async def scenario():
+        return await asyncio.gather(*[
+            run_idempotent(session(), "u", "generate-test", "k", fingerprint(b""),
+                           counting_handler(calls, "A", delay=0.1))
+            for _ in range(3)
+        ])
+
+    responses = asyncio.run(scenario())
+    assert {r.body for r in responses} == {b'{"body":"A"}'}
+    assert calls == ["A"]
+
+
+def test_cancelled_first_execution_lets_duplicates_claim_the_key(session):
+    calls = []
+
+    async def scenario():
+        first = asyncio.create_task(run_idempotent(
+            session(), "u", "generate-test", "k", fingerprint(b""), counting_handler(calls, "A", delay=10)
+        ))
+        await asyncio.sleep(0.05)
+        duplicates = [
+            asyncio.create_task(run_idempotent(
+                session(), "u", "generate-test", "k", fingerprint(b""), counting_handler(calls, "B", delay=0.05)
+            ))
+            for _ in range(2)
+        ]
+        await asyncio.sleep(0.05)
+        first.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await first
+        return await asyncio.gather(*duplicates)
+
+    responses = asyncio.run(scenario())
+    assert [r.status_code for r in responses] == [200, 200]
+    assert {r.body for r in responses} == {b'{"body":"B"}'}
+    assert calls == ["A", "B"]
+    assert session().query(IdempotencyRecord).one().status == "completed"
+
+
+def _orphan_claim(age_seconds: float):
+    db = SessionLocal()
+    claimed = datetime.utcnow() - timedelta(seconds=age_seconds)
+    db.add(IdempotencyRecord(
+        user_key="u",
+        endpoint="generate-test",
+        key="k",
+        fingerprint=fingerprint(b""),
+        status="in_progress",
+        created_at=claimed,
+        claimed_at=claimed,
+        expires_at=claimed + timedelta(days=1),
+    ))
+    db.commit()
+    db.close()
+
+
+def test_retry_takes_over_claim_with_expired_lease(monkeypatch, session):
+    monkeypatch.setattr(idempotency, "IDEMPOTENCY_LEASE_SECONDS", 5)
+    _orphan_claim(age_seconds=60)
+    calls = []
+
+    response = asyncio.run(run_idempotent(
+        session(), "u", "generate-test", "k", fingerprint(b""), counting_handler(calls, "A")
+    ))
+
+    assert response.status_code == 200
+    assert calls == ["A"]
+    assert session().query(IdempotencyRecord).one().status == "completed"
+
+
+def test_retry_waits_on_claim_with_live_lease(monkeypatch, session):
+    monkeypatch.setattr(idempotency, "IDEMPOTENCY_LEASE_SECONDS", 60)
+    monkeypatch.setattr(idempotency, "IDEMPOTENCY_WAIT_SECONDS", 0.3)
+    _orphan_claim(age_seconds=1)
+    calls = []
+
+    with pytest.raises(HTTPException) as exc:
+        asyncio.run(run_idempotent(
+            session(), "u", "generate-test", "k", fingerprint(b""), counting_handler(calls, "A")
+        ))
+
+    assert exc.value.status_code == 409
+    assert calls == []